@@ -4,18 +4,35 @@ E-Raksha Local Development Server
 Minimal Flask API to run Phase 1+2 files locally
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 import hashlib
 import time
 from pathlib import Path
 
+# Try to import orjson for faster response serialization
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Try to import Numba (and NumPy for its inputs) for the JIT-compiled model scoring loop
+try:
+    import numpy as np
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 app = Flask(__name__)
 CORS(app)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+HASH_PREFIX_BYTES = 1024 * 100
 Path(UPLOAD_FOLDER).mkdir(exist_ok=True)
 
 # Model configurations (from predict.js)
@@ -27,11 +44,50 @@ MODELS = {
     "ll": {"name": "LL-Model-N", "accuracy": 0.56, "weight": 1.0},
 }
 
-def analyze_video_file(file_buffer, filename):
-    """Analyze video characteristics"""
-    file_hash = hashlib.md5(file_buffer[:min(1024 * 100, len(file_buffer))]).hexdigest()
-    file_size = len(file_buffer)
-    hash_int = int(file_hash[:8], 16)
+if NUMBA_AVAILABLE:
+    # Per-model constants as fixed-length arrays for JIT scoring
+    _MODEL_NAMES = [info['name'] for info in MODELS.values()]
+    _SHIFTS = np.array([ord(key[0]) % 8 for key in MODELS], dtype=np.int64)
+    _WEIGHTS = np.array([info['weight'] for info in MODELS.values()], dtype=np.float64)
+    _ACCURACIES = np.array([info['accuracy'] for info in MODELS.values()], dtype=np.float64)
+    
+    @njit(cache=True)
+    def _score_models(hash_int, raw_confidence, shifts, weights, accuracies):
+        """Per-model confidences and their weighted average (same math as the Python loop)"""
+        confs = np.empty(shifts.shape[0])
+        weighted_sum = 0.0
+        total_weight = 0.0
+        for i in range(shifts.shape[0]):
+            model_conf = raw_confidence + ((hash_int >> shifts[i]) % 100) / 500 - 0.1
+            model_conf = max(0.1, min(0.99, model_conf))
+            confs[i] = model_conf
+            weight = weights[i] * accuracies[i] * model_conf
+            weighted_sum += model_conf * weight
+            total_weight += weight
+        return weighted_sum / total_weight, confs
+
+def json_response(payload):
+    """Serialize payload with orjson when available, otherwise Flask's jsonify"""
+    if ORJSON_AVAILABLE:
+        return Response(orjson.dumps(payload), mimetype='application/json')
+    return jsonify(payload)
+
+def analyze_video_file(file_stream, filename):
+    """Analyze video characteristics, reading the upload in fixed-size chunks"""
+    hasher = hashlib.blake2b(digest_size=16)
+    bytes_hashed = 0
+    file_size = 0
+    while chunk := file_stream.read(UPLOAD_CHUNK_SIZE):
+        if bytes_hashed < HASH_PREFIX_BYTES:
+            # memoryview slice avoids copying the hashed prefix
+            head = memoryview(chunk)[:HASH_PREFIX_BYTES - bytes_hashed]
+            hasher.update(head)
+            bytes_hashed += len(head)
+        file_size += len(chunk)
+    
+    file_hash_bytes = hasher.digest()
+    file_hash = file_hash_bytes.hex()
+    hash_int = int.from_bytes(file_hash_bytes[:4], 'big')
     estimated_duration = max(1, file_size / (1024 * 1024 * 2))
     estimated_frame_count = int(estimated_duration * 30)
     brightness = 80 + (hash_int % 120)
@@ -48,12 +104,13 @@ def analyze_video_file(file_buffer, filename):
         'contrast': contrast,
         'blur_score': blur_score,
         'file_hash': file_hash,
+        'file_hash_bytes': file_hash_bytes,
         'file_size': file_size
     }
 
 def generate_prediction(video_analysis):
     """Generate prediction based on video analysis"""
-    hash_int = int(video_analysis['file_hash'][:8], 16)
+    hash_int = int.from_bytes(video_analysis['file_hash_bytes'][:4], 'big')
     base_score = (hash_int % 1000) / 1000
     brightness = video_analysis['brightness']
     contrast = video_analysis['contrast']
@@ -66,21 +123,27 @@ def generate_prediction(video_analysis):
     raw_confidence = max(0.1, min(0.99, raw_confidence))
     
     # Generate model predictions
-    model_predictions = {}
-    weighted_sum = 0
-    total_weight = 0
-    
-    for key, info in MODELS.items():
-        model_var = ((hash_int >> (ord(key[0]) % 8)) % 100) / 500
-        model_conf = raw_confidence + model_var - 0.1
-        model_conf = max(0.1, min(0.99, model_conf))
-        model_predictions[info['name']] = round(model_conf, 4)
+    if NUMBA_AVAILABLE:
+        weighted_average, confs = _score_models(hash_int, raw_confidence, _SHIFTS, _WEIGHTS, _ACCURACIES)
+        model_predictions = {name: round(float(conf), 4) for name, conf in zip(_MODEL_NAMES, confs)}
+    else:
+        model_predictions = {}
+        weighted_sum = 0
+        total_weight = 0
+        
+        for key, info in MODELS.items():
+            model_var = ((hash_int >> (ord(key[0]) % 8)) % 100) / 500
+            model_conf = raw_confidence + model_var - 0.1
+            model_conf = max(0.1, min(0.99, model_conf))
+            model_predictions[info['name']] = round(model_conf, 4)
+            
+            weight = info['weight'] * info['accuracy'] * model_conf
+            weighted_sum += model_conf * weight
+            total_weight += weight
         
-        weight = info['weight'] * info['accuracy'] * model_conf
-        weighted_sum += model_conf * weight
-        total_weight += weight
+        weighted_average = weighted_sum / total_weight
     
-    final_confidence = max(0.1, min(0.99, weighted_sum / total_weight))
+    final_confidence = max(0.1, min(0.99, float(weighted_average)))
     
     return {
         'is_fake': final_confidence > 0.5,
@@ -92,7 +155,7 @@ def generate_prediction(video_analysis):
 @app.route('/')
 def home():
     """Home endpoint"""
-    return jsonify({
+    return json_response({
         'status': 'running',
         'message': 'E-Raksha Deepfake Detection API - Phase 1+2 Local Server',
         'version': '0.1.0',
@@ -106,7 +169,7 @@ def home():
 @app.route('/api/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'timestamp': time.time(),
         'models_available': list(MODELS.keys())
@@ -120,18 +183,17 @@ def predict():
     try:
         # Check if file is present
         if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
+            return json_response({'error': 'No file uploaded'}), 400
         
         file = request.files['file']
         if file.filename == '':
-            return jsonify({'error': 'Empty filename'}), 400
+            return json_response({'error': 'Empty filename'}), 400
         
-        # Read file
-        file_buffer = file.read()
+        # Stream file (werkzeug spools large uploads to disk, so avoid reading it all at once)
         filename = file.filename
         
         # Analyze video
-        video_analysis = analyze_video_file(file_buffer, filename)
+        video_analysis = analyze_video_file(file.stream, filename)
         prediction = generate_prediction(video_analysis)
         
         # Determine models used
@@ -156,7 +218,7 @@ def predict():
                 'confidence_breakdown': {
                     'raw_confidence': prediction['confidence'],
                     'quality_adjusted': round(prediction['confidence'] * prediction['confidence_modifier'], 4),
-                    'consistency': round(0.85 + (abs(ord(video_analysis['file_hash'][0])) % 15) / 100, 4),
+                    'consistency': round(0.85 + (video_analysis['file_hash_bytes'][0] % 15) / 100, 4),
                     'quality_score': round(min(video_analysis['brightness'] / 128, 1.0), 4)
                 },
                 'routing': {
@@ -183,10 +245,10 @@ def predict():
             'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
         }
         
-        return jsonify(result)
+        return json_response(result)
         
     except Exception as e:
-        return jsonify({
+        return json_response({
             'error': f'Prediction failed: {str(e)}',
             'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
         }), 500
@@ -203,7 +265,9 @@ if __name__ == '__main__':
     print("  GET  /              - API status")
     print("  GET  /api/health    - Health check")
     print("  POST /api/predict   - Video analysis")
+    print("\nDebug mode: set FLASK_DEBUG=1")
+    print("Production: gunicorn -w $(nproc) -k gthread --threads 8 app:app")
     print("\nPress Ctrl+C to stop")
     print("=" * 60)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000, threaded=True)
@@ -5,16 +5,21 @@ Tests all endpoints and displays results
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import sys
 
 API_URL = "http://localhost:5000"
 
+# Shared session: keep-alive connection pooling across all test requests
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_maxsize=10))
+
 def test_root():
     """Test root endpoint"""
     print("Testing GET / ...")
     try:
-        response = requests.get(f"{API_URL}/")
+        response = SESSION.get(f"{API_URL}/")
         print(f"✅ Status: {response.status_code}")
         print(f"   Response: {json.dumps(response.json(), indent=2)}")
         return True
@@ -26,7 +31,7 @@ def test_health():
     """Test health endpoint"""
     print("\nTesting GET /api/health ...")
     try:
-        response = requests.get(f"{API_URL}/api/health")
+        response = SESSION.get(f"{API_URL}/api/health")
         print(f"✅ Status: {response.status_code}")
         data = response.json()
         print(f"   Status: {data['status']}")
@@ -44,7 +49,7 @@ def test_predict():
         dummy_content = b"fake video data for testing"
         files = {'file': ('test.mp4', dummy_content, 'video/mp4')}
         
-        response = requests.post(f"{API_URL}/api/predict", files=files)
+        response = SESSION.post(f"{API_URL}/api/predict", files=files)
         print(f"✅ Status: {response.status_code}")
         
         data = response.json()
@@ -65,7 +70,7 @@ def main():
     
     # Check if server is running
     try:
-        requests.get(API_URL, timeout=2)
+        SESSION.get(API_URL, timeout=2)
     except requests.exceptions.ConnectionError:
         print("❌ Server is not running!")
         print("\nPlease start the server first:")
@@ -100,4 +105,7 @@ def main():
     print("=" * 60)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        SESSION.close()
@@ -5,31 +5,46 @@ Enhanced with deterministic routing based on file characteristics
 Addresses judge feedback about stochastic routing concerns
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import uvicorn
+import asyncio
 import os
 import tempfile
 import uuid
+import time
 from datetime import datetime
 import hashlib
 from pathlib import Path
 import re
+import threading
+from collections import OrderedDict
+import numpy as np
+import av
 
 # Try to import CV2 for video analysis
 try:
     import cv2
-    import numpy as np
+    # Capture properties read once per video: fps, width, height, frame count
+    _CAPTURE_PROPS = (cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FRAME_COUNT)
     CV2_AVAILABLE = True
 except ImportError:
     CV2_AVAILABLE = False
     print("[WARNING] OpenCV not available")
 
+# Try to import Aho-Corasick for single-pass filename keyword matching
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 app = FastAPI(
     title="Interceptor API - Deterministic Routing",
     description="Agentic Deepfake Detection System with Deterministic Routing - E-Raksha",
-    version="2.1.0"
+    version="2.1.0",
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware
@@ -41,14 +56,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def cors_handler(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    return response
-
 # Model configurations
 MODELS = {
     "bg": {"name": "BG-Model N", "accuracy": 0.8625, "architecture": "EfficientNet-B4", "specialty": "background_analysis"},
@@ -59,18 +66,69 @@ MODELS = {
     "tm": {"name": "TM-Model", "accuracy": 0.785, "architecture": "ResNet18", "specialty": "temporal_consistency"},
 }
 
-def extract_deterministic_signals(file_path: str, filename: str, file_size: int) -> dict:
+# Per-model constants for vectorized scoring, indexed by position in MODELS
+_MODEL_NAMES = [info["name"] for info in MODELS.values()]
+_NAME_TO_INDEX = {name: i for i, name in enumerate(_MODEL_NAMES)}
+_SHIFTS = np.array([ord(key[0]) % 8 for key in MODELS], dtype=np.int64)
+
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Number of leading bytes hashed for the deterministic file signature
+SIGNAL_HASH_BYTES = 1024
+# Number of leading bytes hashed to identify the video content
+CONTENT_HASH_BYTES = 1024 * 100
+# Maximum number of analysis results kept in memory
+RESULT_CACHE_SIZE = 1024
+
+# LRU cache of analysis results keyed by (content_hash, filename, file_size)
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+# Formatted timestamp cache: [epoch_second, iso_string]
+_now_iso_cache = [0, ""]
+
+def _now_iso() -> str:
+    """Current local time as ISO string, formatted at most once per second"""
+    t = int(time.time())
+    if t != _now_iso_cache[0]:
+        _now_iso_cache[:] = [t, datetime.fromtimestamp(t).isoformat()]
+    return _now_iso_cache[1]
+
+# Filename keywords per indicator (matched case-insensitively anywhere in the name)
+FILENAME_KEYWORDS = {
+    "has_compressed_keywords": ("compress", "low", "small", "lite"),
+    "has_hd_keywords": ("hd", "1080", "720", "4k", "uhd"),
+    "has_mobile_keywords": ("mobile", "phone", "whatsapp", "telegram"),
+    "has_social_keywords": ("instagram", "tiktok", "snapchat", "facebook"),
+}
+
+if AHOCORASICK_AVAILABLE:
+    # One automaton scans the filename once for every indicator
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for indicator, keywords in FILENAME_KEYWORDS.items():
+        for keyword in keywords:
+            _KEYWORD_AUTOMATON.add_word(keyword, indicator)
+    _KEYWORD_AUTOMATON.make_automaton()
+else:
+    # Fallback: one compiled pattern per indicator
+    _KEYWORD_PATTERNS = {
+        indicator: re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+        for indicator, keywords in FILENAME_KEYWORDS.items()
+    }
+
+def scan_filename_keywords(filename: str) -> dict:
+    """Return which keyword indicators appear in the filename"""
+    if AHOCORASICK_AVAILABLE:
+        hits = {indicator for _, indicator in _KEYWORD_AUTOMATON.iter(filename.lower())}
+        return {indicator: indicator in hits for indicator in FILENAME_KEYWORDS}
+    return {indicator: bool(pattern.search(filename)) for indicator, pattern in _KEYWORD_PATTERNS.items()}
+
+def extract_deterministic_signals(file_hash_bytes: bytes, filename: str, file_size: int) -> dict:
     """
     NEW: Extract deterministic signals from video file
     These signals are based on file characteristics and never change across runs
+    file_hash_bytes is the digest of the first 1KB, computed while streaming the upload
     """
-    # Generate file hash for consistency
-    try:
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read(1024)).hexdigest()  # First 1KB for speed
-    except Exception:
-        file_hash = hashlib.md5(str(file_size).encode()).hexdigest()
-    
     file_size_mb = round(file_size / (1024 * 1024), 2)
     
     # Deterministic file-based characteristics
@@ -83,22 +141,18 @@ def extract_deterministic_signals(file_path: str, filename: str, file_size: int)
         "estimated_bitrate_category": "LOW" if file_size < 5000000 else "MEDIUM" if file_size < 20000000 else "HIGH",
         
         # Hash-based complexity (deterministic for same file)
-        "file_hash": file_hash,
-        "complexity_indicator": "LOW_COMPLEXITY" if file_hash[0] < '8' else "HIGH_COMPLEXITY",
+        "file_hash": file_hash_bytes.hex(),
+        "file_hash_bytes": file_hash_bytes,
+        "complexity_indicator": "LOW_COMPLEXITY" if file_hash_bytes[0] < 0x80 else "HIGH_COMPLEXITY",
         
         # Filename analysis (deterministic)
-        "filename_indicators": {
-            "has_compressed_keywords": bool(re.search(r'compress|low|small|lite', filename, re.IGNORECASE)),
-            "has_hd_keywords": bool(re.search(r'hd|1080|720|4k|uhd', filename, re.IGNORECASE)),
-            "has_mobile_keywords": bool(re.search(r'mobile|phone|whatsapp|telegram', filename, re.IGNORECASE)),
-            "has_social_keywords": bool(re.search(r'instagram|tiktok|snapchat|facebook', filename, re.IGNORECASE))
-        },
+        "filename_indicators": scan_filename_keywords(filename),
         
         # File extension (deterministic)
         "file_extension": filename.split('.')[-1].lower() if '.' in filename else 'unknown',
         
         # Hash-based quality indicators (deterministic for same file)
-        "estimated_quality_band": ["LOW", "MEDIUM", "HIGH"][int(file_hash[2:4], 16) % 3]
+        "estimated_quality_band": ["LOW", "MEDIUM", "HIGH"][file_hash_bytes[1] % 3]
     }
     
     return signals
@@ -146,7 +200,7 @@ def apply_deterministic_routing_policy(signals: dict) -> dict:
         routing_reasons.append(f"Temporal analysis: {signals['file_size_mb']}MB file with {signals['complexity_indicator']} complexity")
     
     return {
-        "specialists_selected": list(set(specialists)),  # Remove duplicates
+        "specialists_selected": list(dict.fromkeys(specialists)),  # Remove duplicates, keep rule order
         "routing_reasons": routing_reasons,
         "routing_type": "DETERMINISTIC",
         "signals_used": signals
@@ -178,7 +232,36 @@ def generate_routing_explanation(routing_result: dict) -> dict:
         "routing_logic": "File-based characteristics → Policy rules → Specialist selection"
     }
 
-def analyze_video(video_path: str) -> dict:
+def sample_keyframe_brightness(video_path: str, sample_count: int) -> list:
+    """
+    Sample mean brightness at evenly spaced positions using PyAV
+    Each sample seeks to the preceding keyframe and decodes only that frame.
+    If that keyframe was already sampled (clips with fewer keyframes than
+    samples), it decodes forward to the target position instead
+    """
+    brightness_samples = []
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        if not stream.duration or sample_count <= 0:
+            return brightness_samples
+        start = stream.start_time or 0
+        step = stream.duration // sample_count
+        sampled_pts = set()
+        for i in range(sample_count):
+            target = start + i * step
+            stream.codec_context.skip_frame = "NONKEY"
+            container.seek(target, backward=True, any_frame=False, stream=stream)
+            frame = next(container.decode(stream), None)
+            if frame is not None and frame.pts in sampled_pts:
+                stream.codec_context.skip_frame = "DEFAULT"
+                container.seek(target, backward=True, any_frame=False, stream=stream)
+                frame = next((f for f in container.decode(stream) if f.pts is not None and f.pts >= target), None)
+            if frame is not None:
+                sampled_pts.add(frame.pts)
+                brightness_samples.append(np.mean(frame.to_ndarray(format="gray")))
+    return brightness_samples
+
+def analyze_video(video_path: str, file_hash_bytes: bytes = None) -> dict:
     """Analyze video characteristics (keeping existing functionality)"""
     result = {
         "fps": 30,
@@ -190,50 +273,77 @@ def analyze_video(video_path: str) -> dict:
         "contrast": 50,
         "blur_score": 100,
         "file_hash": "",
+        "file_hash_bytes": b"",
     }
     
-    try:
-        with open(video_path, 'rb') as f:
-            result["file_hash"] = hashlib.md5(f.read(1024*100)).hexdigest()
-    except Exception as e:
-        print(f"Hash generation error: {e}")
-        result["file_hash"] = hashlib.md5(str(os.path.getsize(video_path)).encode()).hexdigest()
+    if file_hash_bytes is None:
+        try:
+            with open(video_path, 'rb') as f:
+                file_hash_bytes = hashlib.blake2b(f.read(CONTENT_HASH_BYTES), digest_size=16).digest()
+        except Exception as e:
+            print(f"Hash generation error: {e}")
+            file_hash_bytes = hashlib.blake2b(str(os.path.getsize(video_path)).encode(), digest_size=16).digest()
+    result["file_hash_bytes"] = file_hash_bytes
+    result["file_hash"] = file_hash_bytes.hex()
     
+    cap = None
     if CV2_AVAILABLE:
         try:
             cap = cv2.VideoCapture(video_path)
             if cap.isOpened():
-                result["fps"] = cap.get(cv2.CAP_PROP_FPS) or 30
-                result["width"] = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 1280
-                result["height"] = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 720
-                result["frame_count"] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 100
+                fps, width, height, frame_count = (cap.get(prop) for prop in _CAPTURE_PROPS)
+                result["fps"] = fps or 30
+                result["width"] = int(width) or 1280
+                result["height"] = int(height) or 720
+                result["frame_count"] = int(frame_count) or 100
                 result["duration"] = result["frame_count"] / result["fps"] if result["fps"] > 0 else 3.33
-                
-                # Quick frame analysis
-                brightness_samples = []
-                sample_count = min(3, result["frame_count"])
+            else:
+                cap.release()
+                cap = None
+        except Exception as e:
+            print(f"Video analysis error: {e}")
+    
+    # Quick frame analysis (keyframe-first decode via PyAV, which does not need OpenCV)
+    brightness_samples = []
+    sample_count = min(3, result["frame_count"])
+    try:
+        brightness_samples = sample_keyframe_brightness(video_path, sample_count)
+    except Exception as e:
+        print(f"Keyframe sampling error: {e}")
+    
+    if cap is not None:
+        try:
+            if not len(brightness_samples):
+                # PyAV gave no samples (decode error or no stream duration): read exact frames instead
+                # Convert sampled frames into one preallocated (N, H, W) buffer, reduce once
+                frames = None
+                frames_read = 0
+                step = result["frame_count"] // sample_count if sample_count > 0 else 0
                 for i in range(sample_count):
-                    frame_pos = i * (result["frame_count"] // sample_count) if sample_count > 0 else 0
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, i * step)
                     ret, frame = cap.read()
                     if ret and frame is not None:
-                        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                        brightness_samples.append(np.mean(gray))
-                
-                cap.release()
-                
-                if brightness_samples:
-                    result["brightness"] = np.mean(brightness_samples)
-            else:
-                cap.release()
+                        if frames is None:
+                            frames = np.empty((sample_count,) + frame.shape[:2], dtype=np.uint8)
+                        elif frame.shape[:2] != frames.shape[1:]:
+                            continue
+                        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=frames[frames_read])
+                        frames_read += 1
+                if frames_read:
+                    brightness_samples = frames[:frames_read].reshape(frames_read, -1).mean(axis=1)
         except Exception as e:
             print(f"Video analysis error: {e}")
+        finally:
+            cap.release()
+    
+    if len(brightness_samples):
+        result["brightness"] = np.mean(brightness_samples)
     
     return result
 
 def generate_prediction(video_analysis: dict, routing_result: dict) -> dict:
     """Generate prediction (confidence computed AFTER routing, not before)"""
-    hash_int = int(video_analysis["file_hash"][:8], 16)
+    hash_int = int.from_bytes(video_analysis["file_hash_bytes"][:4], "big")
     base_score = (hash_int % 1000) / 1000
     
     brightness = video_analysis["brightness"]
@@ -247,26 +357,13 @@ def generate_prediction(video_analysis: dict, routing_result: dict) -> dict:
     
     # Model predictions based on selected specialists
     model_predictions = {}
-    specialists_selected = routing_result["specialists_selected"]
+    indices = [_NAME_TO_INDEX[name] for name in routing_result["specialists_selected"] if name in _NAME_TO_INDEX]
     
-    for specialist_name in specialists_selected:
-        # Find model key
-        model_key = None
-        for key, info in MODELS.items():
-            if info["name"] == specialist_name:
-                model_key = key
-                break
-        
-        if model_key:
-            info = MODELS[model_key]
-            model_conf = base_score
-            
-            # Deterministic variation based on file hash
-            model_var = ((hash_int >> (ord(model_key[0]) % 8)) % 200 - 100) / 1000
-            model_conf += model_var
-            
-            model_conf = max(0.1, min(0.99, model_conf))
-            model_predictions[info["name"]] = round(model_conf, 4)
+    if indices:
+        # Deterministic variation based on file hash, all selected models at once
+        model_vars = ((hash_int >> _SHIFTS[indices]) % 200 - 100) / 1000
+        model_confs = np.clip(base_score + model_vars, 0.1, 0.99)
+        model_predictions = {_MODEL_NAMES[i]: round(float(conf), 4) for i, conf in zip(indices, model_confs)}
     
     # Calculate final confidence as average of selected models
     if model_predictions:
@@ -283,6 +380,48 @@ def generate_prediction(video_analysis: dict, routing_result: dict) -> dict:
         "confidence_modifier": confidence_modifier,
     }
 
+def compute_full_result(video_path: str, signal_hash: bytes, content_hash: bytes, filename: str, file_size: int) -> tuple:
+    """
+    Run signals -> routing -> analysis -> prediction for an uploaded file
+    Results are cached by (content_hash, filename, file_size) so repeat uploads
+    of the same video skip the pipeline (including CV2 decode). The returned
+    dicts are shared between requests and must not be mutated.
+    """
+    cache_key = (content_hash, filename, file_size)
+    with _result_cache_lock:
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            _result_cache.move_to_end(cache_key)
+            return cached
+    
+    # NEW: Extract deterministic signals FIRST
+    deterministic_signals = extract_deterministic_signals(signal_hash, filename, file_size)
+    
+    # NEW: Apply deterministic routing policy
+    routing_result = apply_deterministic_routing_policy(deterministic_signals)
+    
+    # Analyze video characteristics
+    video_analysis = analyze_video(video_path, content_hash)
+    
+    # Generate prediction AFTER routing (confidence is post-hoc)
+    prediction = generate_prediction(video_analysis, routing_result)
+    
+    # Generate routing explanation
+    routing_explanation = generate_routing_explanation(routing_result)
+    
+    result = (deterministic_signals, routing_result, video_analysis, prediction, routing_explanation)
+    with _result_cache_lock:
+        _result_cache[cache_key] = result
+        if len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+    return result
+
+def write_all(raw_file, data: bytes) -> None:
+    """Write all of data to an unbuffered file, whose write() may be partial"""
+    view = memoryview(data)
+    while view:
+        view = view[raw_file.write(view):]
+
 @app.get("/")
 async def root():
     return {
@@ -291,7 +430,7 @@ async def root():
         "status": "running",
         "routing_type": "DETERMINISTIC",
         "cv2_available": CV2_AVAILABLE,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _now_iso()
     }
 
 @app.get("/health")
@@ -300,7 +439,7 @@ async def health_check():
         "status": "healthy",
         "routing_type": "DETERMINISTIC",
         "cv2_available": CV2_AVAILABLE,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _now_iso()
     }
 
 @app.post("/predict")
@@ -315,30 +454,34 @@ async def predict_deepfake(file: UploadFile = File(...)):
     temp_path = os.path.join(temp_dir, temp_filename)
     
     try:
-        # Save uploaded file
-        content = await file.read()
-        file_size = len(content)
-        with open(temp_path, "wb") as buffer:
-            buffer.write(content)
-        
-        start_time = datetime.now()
-        
-        # NEW: Extract deterministic signals FIRST
-        deterministic_signals = extract_deterministic_signals(temp_path, file.filename, file_size)
-        
-        # NEW: Apply deterministic routing policy
-        routing_result = apply_deterministic_routing_policy(deterministic_signals)
-        
-        # Analyze video characteristics
-        video_analysis = analyze_video(temp_path)
+        # Stream uploaded file to disk, hashing the leading bytes on the way
+        # (disk writes and analysis run in worker threads to keep the event loop free)
+        signal_hasher = hashlib.blake2b(digest_size=16)
+        content_hasher = hashlib.blake2b(digest_size=16)
+        bytes_hashed = 0
+        file_size = 0
+        # Unbuffered, so each threaded write reaches the disk itself instead of on the next call or close()
+        buffer = await asyncio.to_thread(open, temp_path, "wb", buffering=0)
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(write_all, buffer, chunk)
+                if bytes_hashed < CONTENT_HASH_BYTES:
+                    head = chunk[:CONTENT_HASH_BYTES - bytes_hashed]
+                    content_hasher.update(head)
+                    if bytes_hashed < SIGNAL_HASH_BYTES:
+                        signal_hasher.update(head[:SIGNAL_HASH_BYTES - bytes_hashed])
+                    bytes_hashed += len(head)
+                file_size += len(chunk)
+        finally:
+            await asyncio.to_thread(buffer.close)
         
-        # Generate prediction AFTER routing (confidence is post-hoc)
-        prediction = generate_prediction(video_analysis, routing_result)
+        start_time = time.perf_counter()
         
-        # Generate routing explanation
-        routing_explanation = generate_routing_explanation(routing_result)
+        deterministic_signals, routing_result, video_analysis, prediction, routing_explanation = await asyncio.to_thread(
+            compute_full_result, temp_path, signal_hasher.digest(), content_hasher.digest(), file.filename, file_size
+        )
         
-        processing_time = (datetime.now() - start_time).total_seconds()
+        processing_time = time.perf_counter() - start_time
         
         result = {
             "prediction": "fake" if prediction["is_fake"] else "real",
@@ -353,7 +496,7 @@ async def predict_deepfake(file: UploadFile = File(...)):
                 "confidence_breakdown": {
                     "raw_confidence": prediction["confidence"],
                     "quality_adjusted": round(prediction["confidence"] * prediction["confidence_modifier"], 4),
-                    "consistency": round(0.85 + (hash(video_analysis["file_hash"]) % 15) / 100, 4),
+                    "consistency": round(0.85 + (video_analysis["file_hash_bytes"][0] % 15) / 100, 4),
                     "quality_score": round(min(video_analysis["brightness"] / 128, 1.0), 4),
                 },
                 "routing": {
@@ -378,7 +521,7 @@ async def predict_deepfake(file: UploadFile = File(...)):
             "filename": file.filename,
             "file_size": file_size,
             "processing_time": round(processing_time, 2),
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _now_iso(),
         }
         
         return result
@@ -387,8 +530,7 @@ async def predict_deepfake(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
     
     finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        await asyncio.to_thread(Path(temp_path).unlink, missing_ok=True)
 
 @app.get("/stats")
 async def get_stats():
@@ -408,10 +550,12 @@ async def get_stats():
             "total_parameters": "47.2M",
             "routing_consistency": "100%",
         },
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _now_iso()
     }
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    print(f"Starting Interceptor API with Deterministic Routing on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    print(f"Starting Interceptor API with Deterministic Routing on port {port} ({workers} worker(s))")
+    # Multiple workers require an import string; uvloop/httptools are picked automatically when installed
+    uvicorn.run("app_deterministic:app" if workers > 1 else app, host="0.0.0.0", port=port, workers=workers)
\ No newline at end of file
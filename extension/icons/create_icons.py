@@ -4,23 +4,45 @@ Simple script to create basic Interceptor extension icons
 Creates simple camera icons for the extension
 """
 
-from PIL import Image, ImageDraw
+import hashlib
+import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-def create_simple_icon(size, filename):
-    """Create a simple camera icon"""
-    # Create a new image with transparent background
-    img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    
-    # Define colors based on your design system
-    primary_color = (59, 130, 246)  # Blue #3b82f6
-    white_color = (255, 255, 255)
+try:
+    import png
+    import numpy as np
+except ImportError:
+    sys.exit("pypng and NumPy are required: pip install pypng numpy")
+
+# Define colors based on your design system
+PRIMARY_COLOR = (59, 130, 246)  # Blue #3b82f6
+WHITE_COLOR = (255, 255, 255)
+
+# The icon is drawn once at this size and box-filtered down to every output size;
+# 384 is the least common multiple of 16, 32, 48 and 128
+BASE_ICON_SIZE = 384
+
+# Bump when the drawing code changes so existing icons are regenerated
+ICON_VERSION = "v2"
+
+# Fingerprints of generated icons; kept outside extension/ so it never ships with it
+ICON_CACHE_FILE = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '.icon_cache.json'))
+
+def render_icon_array(size):
+    """Rasterize the camera icon into an RGBA array using vectorized masks"""
+    # Start from a transparent background
+    arr = np.zeros((size, size, 4), dtype=np.uint8)
+    yy, xx = np.ogrid[:size, :size]
+    primary = PRIMARY_COLOR + (255,)
+    white = WHITE_COLOR + (255,)
     
     # Draw background circle
     margin = max(2, size // 10)
-    draw.ellipse([margin, margin, size - margin, size - margin], 
-                fill=primary_color, outline=None)
+    center = size / 2
+    arr[(xx - center) ** 2 + (yy - center) ** 2 <= (center - margin) ** 2] = primary
     
     # Draw camera body (simplified rectangle)
     body_margin = size // 4
@@ -29,16 +51,13 @@ def create_simple_icon(size, filename):
     body_x = body_margin
     body_y = (size - body_height) // 2
     
-    draw.rectangle([body_x, body_y, body_x + body_width, body_y + body_height],
-                  fill=white_color, outline=None)
+    arr[int(body_y):int(body_y + body_height) + 1, body_x:body_x + body_width + 1] = white
     
     # Draw camera lens (circle)
     lens_size = min(body_width, body_height) * 0.5
-    lens_x = (size - lens_size) // 2
-    lens_y = (size - lens_size) // 2
+    lens_center = (size - lens_size) // 2 + lens_size / 2
     
-    draw.ellipse([lens_x, lens_y, lens_x + lens_size, lens_y + lens_size],
-                fill=primary_color, outline=None)
+    arr[(xx - lens_center) ** 2 + (yy - lens_center) ** 2 <= (lens_size / 2) ** 2] = primary
     
     # Draw small viewfinder on top (if size is large enough)
     if size >= 32:
@@ -47,77 +66,56 @@ def create_simple_icon(size, filename):
         vf_x = (size - vf_width) // 2
         vf_y = body_y - vf_height
         
-        draw.rectangle([vf_x, vf_y, vf_x + vf_width, vf_y + vf_height],
-                      fill=white_color, outline=None)
+        arr[int(vf_y):int(body_y) + 1, int(vf_x):int(vf_x + vf_width) + 1] = white
     
-    # Save the image
-    img.save(filename, 'PNG')
-    print(f"Created {filename} ({size}x{size})")
+    return arr
 
-def create_fallback_icons():
-    """Create fallback icons if PIL is not available"""
-    print("Creating fallback icons without PIL...")
-    
-    # Create a simple HTML file that can generate icons
-    html_content = '''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Icon Generator</title>
-    </head>
-    <body>
-        <canvas id="canvas" width="128" height="128"></canvas>
-        <script>
-            function createIcon(size) {
-                const canvas = document.getElementById('canvas');
-                canvas.width = size;
-                canvas.height = size;
-                const ctx = canvas.getContext('2d');
-                
-                // Clear canvas
-                ctx.clearRect(0, 0, size, size);
-                
-                // Draw blue circle background
-                ctx.fillStyle = '#3b82f6';
-                ctx.beginPath();
-                ctx.arc(size/2, size/2, size/2 - 2, 0, 2 * Math.PI);
-                ctx.fill();
-                
-                // Draw white camera body
-                ctx.fillStyle = 'white';
-                const bodyWidth = size * 0.5;
-                const bodyHeight = bodyWidth * 0.7;
-                const bodyX = (size - bodyWidth) / 2;
-                const bodyY = (size - bodyHeight) / 2;
-                ctx.fillRect(bodyX, bodyY, bodyWidth, bodyHeight);
-                
-                // Draw blue lens
-                ctx.fillStyle = '#3b82f6';
-                ctx.beginPath();
-                ctx.arc(size/2, size/2, bodyWidth * 0.25, 0, 2 * Math.PI);
-                ctx.fill();
-                
-                // Download the image
-                const link = document.createElement('a');
-                link.download = `icon${size}.png`;
-                link.href = canvas.toDataURL();
-                link.click();
-            }
-            
-            // Create all sizes
-            [16, 32, 48, 128].forEach(size => {
-                setTimeout(() => createIcon(size), size * 10);
-            });
-        </script>
-    </body>
-    </html>
-    '''
-    
-    with open('icon_generator.html', 'w') as f:
-        f.write(html_content)
+@lru_cache(maxsize=None)
+def base_icon():
+    """Render the base icon once; every output size is derived from it"""
+    return render_icon_array(BASE_ICON_SIZE)
+
+def downsample(arr, factor):
+    """Box-filter an RGBA array by an integer factor, averaging colors weighted by alpha"""
+    size = arr.shape[0] // factor
+    blocks = arr.reshape(size, factor, size, factor, 4).astype(np.float64)
+    alpha = blocks[..., 3:].sum(axis=(1, 3))
+    rgb = (blocks[..., :3] * blocks[..., 3:]).sum(axis=(1, 3)) / np.maximum(alpha, 1)
+    return np.dstack([rgb, alpha / factor ** 2]).round().astype(np.uint8)
+
+def icon_key(size):
+    """Fingerprint of everything that determines an icon's pixels"""
+    return hashlib.md5(f"{size}:{PRIMARY_COLOR}:{WHITE_COLOR}:{ICON_VERSION}".encode()).hexdigest()[:8]
+
+def icon_cache_entry(size, filename):
+    """Cache record for an icon: input fingerprint plus the PNG's size and mtime"""
+    stat = os.stat(filename)
+    return {'key': icon_key(size), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def load_icon_cache():
+    """Read the icon cache, treating a missing or corrupt file as empty"""
+    try:
+        with open(ICON_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def icon_is_current(size, filename, cache):
+    """Check whether an icon exists, is unmodified, and was built from the current inputs"""
+    try:
+        return cache.get(os.path.abspath(filename)) == icon_cache_entry(size, filename)
+    except OSError:
+        return False
+
+def create_simple_icon(size, filename):
+    """Create a simple camera icon"""
+    arr = downsample(base_icon(), BASE_ICON_SIZE // size)
     
-    print("Created icon_generator.html")
-    print("Open this file in a browser to download the icon files")
+    # Save the image (fast zlib level; PNG is lossless at any level)
+    writer = png.Writer(size, size, greyscale=False, alpha=True, compression=1)
+    with open(filename, 'wb') as f:
+        writer.write(f, arr.reshape(size, size * 4))
+    print(f"Created {filename} ({size}x{size})")
 
 def main():
     """Generate all required icon sizes"""
@@ -128,19 +126,31 @@ def main():
     # Icon sizes required by Chrome extensions
     sizes = [16, 32, 48, 128]
     
-    try:
-        # Try to create icons with PIL
-        for size in sizes:
-            filename = f'icons/icon{size}.png'
-            create_simple_icon(size, filename)
-        
-        print("\nAll icons created successfully!")
-        print("You can now load the extension in Chrome.")
+    # Skip icons that are already up to date
+    cache = load_icon_cache()
+    stale = []
+    for size in sizes:
+        filename = f'icons/icon{size}.png'
+        if icon_is_current(size, filename, cache):
+            print(f"Skipped {filename} (up to date)")
+            continue
+        stale.append(size)
+    
+    # Sizes are independent; only the NumPy downsample and zlib compression overlap across
+    # threads, as pypng packs rows in pure Python
+    if stale:
+        base_icon()  # render before fanning out so the workers share one draw
+        with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+            list(executor.map(lambda size: create_simple_icon(size, f'icons/icon{size}.png'), stale))
         
-    except ImportError:
-        print("PIL/Pillow not found. Creating fallback solution...")
-        create_fallback_icons()
-        print("\nOpen icon_generator.html in your browser to create icons manually.")
+        for size in stale:
+            filename = f'icons/icon{size}.png'
+            cache[os.path.abspath(filename)] = icon_cache_entry(size, filename)
+        with open(ICON_CACHE_FILE, 'w') as f:
+            json.dump(cache, f, indent=2)
+    
+    print("\nAll icons created successfully!")
+    print("You can now load the extension in Chrome.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,9 +5,11 @@ Validates that same video files produce identical routing decisions
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import hashlib
 import time
+from functools import lru_cache
 from pathlib import Path
 
 # Test configuration
@@ -15,18 +17,45 @@ API_BASE_URL = "http://localhost:8000"  # Backend API
 TEST_VIDEO_PATH = "test_video.mp4"  # Place a test video here
 NUM_CONSISTENCY_TESTS = 5
 
-def test_deterministic_routing():
+# Shared session: keep-alive connection pooling across all test requests
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_maxsize=10))
+
+# First successful /predict response per video SHA-256
+RESPONSE_CACHE = {}
+
+@lru_cache(maxsize=None)
+def load_test_video():
+    """Read the test video once and return (bytes, sha256 hex digest)"""
+    with open(TEST_VIDEO_PATH, 'rb') as video_file:
+        video_bytes = video_file.read()
+    return video_bytes, hashlib.sha256(video_bytes).hexdigest()
+
+def predict_test_video(session, video, use_cache=False):
+    """Upload the test video to /predict, optionally reusing an earlier response"""
+    video_bytes, video_sha = video
+    if use_cache and video_sha in RESPONSE_CACHE:
+        return RESPONSE_CACHE[video_sha]
+    
+    files = {'file': (Path(TEST_VIDEO_PATH).name, video_bytes, 'video/mp4')}
+    response = session.post(f"{API_BASE_URL}/predict", files=files)
+    
+    # Only wait when the server explicitly asks us to back off
+    retry_after = response.headers.get('Retry-After', '')
+    if response.status_code in (429, 503) and retry_after.isdigit():
+        time.sleep(int(retry_after))
+        response = session.post(f"{API_BASE_URL}/predict", files=files)
+    
+    if response.status_code == 200:
+        RESPONSE_CACHE.setdefault(video_sha, response)
+    return response
+
+def test_deterministic_routing(session=SESSION, video=None):
     """Test that same video produces identical routing decisions"""
     
     print("🧪 Testing Deterministic Routing Consistency")
     print("=" * 50)
     
-    # Check if test video exists
-    if not Path(TEST_VIDEO_PATH).exists():
-        print(f"❌ Test video not found: {TEST_VIDEO_PATH}")
-        print("Please place a test video file in the current directory")
-        return False
-    
     print(f"📹 Using test video: {TEST_VIDEO_PATH}")
     print(f"🔄 Running {NUM_CONSISTENCY_TESTS} consistency tests...")
     
@@ -37,10 +66,10 @@ def test_deterministic_routing():
         print(f"\n🔍 Test {i+1}/{NUM_CONSISTENCY_TESTS}")
         
         try:
-            # Upload video to deterministic API
-            with open(TEST_VIDEO_PATH, 'rb') as video_file:
-                files = {'file': video_file}
-                response = requests.post(f"{API_BASE_URL}/predict", files=files)
+            video = video or load_test_video()
+            
+            # Upload video to deterministic API (always a fresh request)
+            response = predict_test_video(session, video)
             
             if response.status_code != 200:
                 print(f"❌ API error: {response.status_code}")
@@ -57,36 +86,40 @@ def test_deterministic_routing():
                 'routing_reasons': result.get('routing_explanation', {}).get('routing_reasons', [])
             }
             
-            results.append(routing_info)
+            # Canonical fingerprint of the routing decision
+            digest = hashlib.blake2b(json.dumps(routing_info, sort_keys=True, default=str).encode(), digest_size=16).digest()
+            results.append((digest, routing_info))
             
             print(f"   ✅ Models used: {routing_info['models_used']}")
+            print(f"   🔑 Routing fingerprint: {digest.hex()}")
             print(f"   📊 Routing type: {result.get('routing_explanation', {}).get('routing_decision', 'N/A')}")
             
         except Exception as e:
             print(f"❌ Test {i+1} failed: {str(e)}")
             return False
-        
-        # Small delay between requests
-        time.sleep(0.5)
     
     # Validate consistency
     print(f"\n🔍 Validating Consistency Across {NUM_CONSISTENCY_TESTS} Tests")
     print("-" * 40)
     
-    # Check if all routing decisions are identical
-    first_result = results[0]
-    all_consistent = True
+    # Check if all routing decisions are identical (compare fingerprints, diff fields only on mismatch)
+    first_digest, first_result = results[0]
+    all_consistent = all(digest == first_digest for digest, _ in results[1:])
     
-    for i, result in enumerate(results[1:], 2):
-        if result['models_used'] != first_result['models_used']:
-            print(f"❌ Test {i}: Models used differ!")
-            print(f"   Expected: {first_result['models_used']}")
-            print(f"   Got: {result['models_used']}")
-            all_consistent = False
-        
-        if result['routing_reasons'] != first_result['routing_reasons']:
-            print(f"❌ Test {i}: Routing reasons differ!")
-            all_consistent = False
+    if not all_consistent:
+        for i, (digest, result) in enumerate(results[1:], 2):
+            if digest == first_digest:
+                continue
+            
+            print(f"❌ Test {i}: Routing fingerprint differs ({digest.hex()})")
+            
+            if result['models_used'] != first_result['models_used']:
+                print(f"❌ Test {i}: Models used differ!")
+                print(f"   Expected: {first_result['models_used']}")
+                print(f"   Got: {result['models_used']}")
+            
+            if result['routing_reasons'] != first_result['routing_reasons']:
+                print(f"❌ Test {i}: Routing reasons differ!")
     
     if all_consistent:
         print("✅ All routing decisions are identical!")
@@ -106,7 +139,7 @@ def test_deterministic_routing():
         print("❌ Routing decisions are NOT consistent!")
         return False
 
-def test_different_videos_different_routing():
+def test_different_videos_different_routing(session=SESSION, video=None):
     """Test that different videos can produce different routing (when appropriate)"""
     
     print(f"\n🧪 Testing Different Videos Produce Appropriate Routing")
@@ -119,20 +152,17 @@ def test_different_videos_different_routing():
     
     return True
 
-def test_api_response_format():
+def test_api_response_format(session=SESSION, video=None):
     """Test that API response includes all required deterministic routing fields"""
     
     print(f"\n🧪 Testing API Response Format")
     print("=" * 30)
     
-    if not Path(TEST_VIDEO_PATH).exists():
-        print(f"❌ Test video not found: {TEST_VIDEO_PATH}")
-        return False
-    
     try:
-        with open(TEST_VIDEO_PATH, 'rb') as video_file:
-            files = {'file': video_file}
-            response = requests.post(f"{API_BASE_URL}/predict", files=files)
+        video = video or load_test_video()
+        
+        # Format check can reuse a response already fetched for this video
+        response = predict_test_video(session, video, use_cache=True)
         
         if response.status_code != 200:
             print(f"❌ API error: {response.status_code}")
@@ -193,6 +223,20 @@ def main():
     print("🚀 E-Raksha Deterministic Routing Test Suite")
     print("=" * 60)
     
+    # Preflight once: test video present and API reachable
+    if not Path(TEST_VIDEO_PATH).exists():
+        print(f"❌ Test video not found: {TEST_VIDEO_PATH}")
+        print("Please place a test video file in the current directory")
+        return False
+    
+    try:
+        SESSION.get(API_BASE_URL, timeout=2)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ API server is not reachable at {API_BASE_URL}: {e}")
+        return False
+    
+    video = load_test_video()
+    
     tests = [
         ("Routing Consistency", test_deterministic_routing),
         ("API Response Format", test_api_response_format),
@@ -205,7 +249,7 @@ def main():
     for test_name, test_func in tests:
         print(f"\n🧪 Running: {test_name}")
         try:
-            if test_func():
+            if test_func(SESSION, video):
                 print(f"✅ {test_name}: PASSED")
                 passed += 1
             else:
@@ -223,5 +267,8 @@ def main():
         return False
 
 if __name__ == "__main__":
-    success = main()
+    try:
+        success = main()
+    finally:
+        SESSION.close()
     exit(0 if success else 1)
\ No newline at end of file